@@ -5,7 +5,7 @@ MongoDB helper functions ready to use in your backend code.
 Import and use these functions in your API endpoints for database operations.
 """
 
-from pymongo import MongoClient
+from motor.motor_asyncio import AsyncIOMotorClient
 from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
@@ -21,29 +21,44 @@ db = None
 database_url = os.getenv("DATABASE_URL")
 database_name = os.getenv("DATABASE_NAME")
 
+# Connection pool sizing; minPoolSize keeps warm sockets around so the first
+# requests after startup don't pay the connection handshake.
+MAX_POOL_SIZE = 50
+MIN_POOL_SIZE = 10
+
 if database_url and database_name:
-    _client = MongoClient(database_url)
+    _client = AsyncIOMotorClient(
+        database_url,
+        maxPoolSize=MAX_POOL_SIZE,
+        minPoolSize=MIN_POOL_SIZE,
+        serverSelectionTimeoutMS=3000,
+        socketTimeoutMS=5000,
+    )
     db = _client[database_name]
 
-# Helper functions for common database operations
-def create_document(collection_name: str, data: Union[BaseModel, dict]):
-    """Insert a single document with timestamp"""
-    if db is None:
-        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
-
+def _with_timestamps(data: Union[BaseModel, dict]) -> dict:
+    """Copy data into a plain dict and stamp created_at/updated_at"""
     # Convert Pydantic model to dict if needed
     if isinstance(data, BaseModel):
         data_dict = data.model_dump()
     else:
         data_dict = data.copy()
 
-    data_dict['created_at'] = datetime.now(timezone.utc)
-    data_dict['updated_at'] = datetime.now(timezone.utc)
+    now = datetime.now(timezone.utc)
+    data_dict['created_at'] = now
+    data_dict['updated_at'] = now
+    return data_dict
+
+# Helper functions for common database operations
+async def create_document(collection_name: str, data: Union[BaseModel, dict]):
+    """Insert a single document with timestamp"""
+    if db is None:
+        raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
 
-    result = db[collection_name].insert_one(data_dict)
+    result = await db[collection_name].insert_one(_with_timestamps(data))
     return str(result.inserted_id)
 
-def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
+async def get_documents(collection_name: str, filter_dict: dict = None, limit: int = None):
     """Get documents from collection"""
     if db is None:
         raise Exception("Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.")
@@ -52,4 +67,4 @@ def get_documents(collection_name: str, filter_dict: dict = None, limit: int = N
     if limit:
         cursor = cursor.limit(limit)
     
-    return list(cursor)
+    return await cursor.to_list(length=limit or None)
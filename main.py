@@ -1,14 +1,26 @@
+import asyncio
+import functools
+import logging
 import os
-from datetime import datetime, timezone
-from typing import List, Dict, Any
-
-from fastapi import FastAPI, HTTPException
+import re
+import time
+from datetime import date, datetime, timedelta, timezone
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Tuple
+
+from bson import ObjectId
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+from database import db, create_document, get_documents, MIN_POOL_SIZE
+from schemas import Challenge, Story, Feedback, Timelineevent, Practiceresult
 
-from database import db, create_document, get_documents
+logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -18,10 +30,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ---------- Startup ----------
+
+@app.on_event("startup")
+async def warm_database_pool():
+    if db is None:
+        return
+    try:
+        # concurrent pings force the pool to open MIN_POOL_SIZE connections
+        await asyncio.gather(*(db.command("ping") for _ in range(MIN_POOL_SIZE)))
+    except Exception as e:
+        logger.warning("Database warm-up failed: %s", e)
+
+@app.on_event("startup")
+async def ensure_indexes():
+    if db is None:
+        return
+    try:
+        # timeline is ordered by _id, which is always indexed
+        await db["challenge"].create_index([("date", 1)], unique=True)
+    except Exception as e:
+        logger.warning("Index creation failed: %s", e)
+
 # ---------- Utilities ----------
 
+# A token is a run of word characters (any script, digits included) with
+# inner apostrophes kept, so "don't" is one token and "'hello'" == "hello";
+# bare punctuation is not a token.
+_TOKEN_RE = re.compile(r"\w+(?:'\w+)*")
+# capturing group keeps each sentence's own terminator in the split output
+_SENT_SPLIT = re.compile(r"([.?!]+)")
+
+# Cached ISO day string, refreshed at most once a second (and never held past
+# UTC midnight) using the monotonic clock as the guard.
+_TODAY: Dict[str, Any] = {"expires": 0.0, "d": ""}
+
+def _seconds_until_midnight(now: Optional[datetime] = None) -> float:
+    now = now or datetime.now(timezone.utc)
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return (midnight - now).total_seconds()
+
 def today_str() -> str:
-    return datetime.now(timezone.utc).date().isoformat()
+    mono = time.monotonic()
+    if mono >= _TODAY["expires"]:
+        now = datetime.now(timezone.utc)
+        _TODAY["d"] = now.date().isoformat()
+        _TODAY["expires"] = mono + min(1.0, _seconds_until_midnight(now))
+    return _TODAY["d"]
 
 # Simple built-in pool of GRE words and idioms to bootstrap daily challenges
 GRE_POOL = [
@@ -51,6 +106,19 @@ GRE_POOL = [
     },
 ]
 
+# Read-only views of the pool entries, built once at import
+_POOL_READY = tuple(MappingProxyType(dict(p)) for p in GRE_POOL)
+
+# In-process caches keyed by today's date string; the challenge (and the quiz
+# derived from it) only changes at UTC midnight.
+_challenge_cache: Dict[str, Dict[str, Any]] = {}
+_quiz_cache: Dict[str, Dict[str, Any]] = {}
+_inflight: Dict[str, "asyncio.Future[Dict[str, Any]]"] = {}
+
+def _invalidate_cache() -> None:
+    _challenge_cache.clear()
+    _quiz_cache.clear()
+
 # ---------- Models for requests ----------
 
 class StoryCreate(BaseModel):
@@ -64,15 +132,15 @@ class PracticeSubmit(BaseModel):
 # ---------- Health ----------
 
 @app.get("/")
-def read_root():
+async def read_root():
     return {"message": "Hello from FastAPI Backend!"}
 
 @app.get("/api/hello")
-def hello():
+async def hello():
     return {"message": "Hello from the backend API!"}
 
 @app.get("/test")
-def test_database():
+async def test_database():
     response = {
         "backend": "✅ Running",
         "database": "❌ Not Available",
@@ -87,7 +155,7 @@ def test_database():
             response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
             response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
             try:
-                collections = db.list_collection_names()
+                collections = await db.list_collection_names()
                 response["collections"] = collections[:10]
                 response["database"] = "✅ Connected & Working"
                 response["connection_status"] = "Connected"
@@ -101,53 +169,88 @@ def test_database():
 
 # ---------- Challenge ----------
 
+def _cache_headers(request: Request, response: Response, etag: str) -> bool:
+    """Set day-scoped caching headers; True if the client already has this version"""
+    response.headers["Cache-Control"] = f"public, max-age={max(1, int(_seconds_until_midnight()))}"
+    response.headers["ETag"] = etag
+    return request.headers.get("if-none-match") == etag
+
 @app.get("/api/challenge/today")
-def get_today_challenge():
+async def get_today_challenge_endpoint(request: Request, response: Response):
+    etag = f'"{today_str()}"'
+    if _cache_headers(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return await get_today_challenge()
+
+async def get_today_challenge():
     d = today_str()
-    existing = get_documents("challenge", {"date": d}, limit=1)
+    cached = _challenge_cache.get(d)
+    if cached is not None:
+        return cached
+    # single-flight: concurrent callers on a cold cache share one load
+    task = _inflight.get(d)
+    if task is None:
+        task = asyncio.ensure_future(_load_challenge(d))
+        _inflight[d] = task
+        task.add_done_callback(lambda _: _inflight.pop(d, None))
+    return await asyncio.shield(task)
+
+async def _load_challenge(d: str) -> Dict[str, Any]:
+    # date rolled over (or cold start): drop stale entries
+    _invalidate_cache()
+    existing = await get_documents("challenge", {"date": d}, limit=1)
     if existing:
         item = existing[0]
         item["_id"] = str(item.get("_id"))
+        _challenge_cache[d] = item
         return item
     # generate a challenge from pool using day index
-    idx = datetime.now(timezone.utc).timetuple().tm_yday % len(GRE_POOL)
-    pick = GRE_POOL[idx]
-    data = {
-        "date": d,
-        **pick,
-    }
-    _id = create_document("challenge", data)
-    data["_id"] = _id
-    # Add a timeline event for availability
-    create_document("timelineevent", {
+    # index from d itself so the doc and its word always agree on the day
+    idx = date.fromisoformat(d).timetuple().tm_yday % len(_POOL_READY)
+    pick = _POOL_READY[idx]
+    oid = ObjectId()
+    data = {"date": d} | pick
+    _id = str(oid)
+    try:
+        await create_document("challenge", {"_id": oid, **data})
+    except DuplicateKeyError:
+        # another instance created today's challenge first (unique date index)
+        existing = await get_documents("challenge", {"date": d}, limit=1)
+        item = existing[0]
+        item["_id"] = str(item.get("_id"))
+        _challenge_cache[d] = item
+        return item
+    # Add a timeline event for availability, only once the insert has won
+    await create_document("timelineevent", {
         "kind": "milestone",
         "title": f"Daily challenge ready: {pick['word']}",
         "detail": pick["idiom"],
         "ref_id": _id,
         "date": d,
     })
+    data["_id"] = _id
+    _challenge_cache[d] = data
     return data
 
 # ---------- Story & Feedback ----------
 
+def _analyze(text: str, word: str, idiom: str) -> Tuple[int, int, int]:
+    """Return (tokens, unique_words, gre_hits) from a single lowered copy of text"""
+    lower = text.lower()
+    toks = _TOKEN_RE.findall(lower)
+    # presence of each term (0-2), not occurrence counts
+    gre_hits = sum(1 for t in (word.lower(), idiom.lower()) if t and t in lower)
+    return len(toks), len(set(toks)), gre_hits
+
 @app.post("/api/story")
-def submit_story(payload: StoryCreate):
-    # Basic analytics
+async def submit_story(payload: StoryCreate):
     text = payload.text.strip()
-    tokens = len([t for t in text.replace("\n", " ").split(" ") if t])
-    unique_words = len(set(w.strip('.,!?;:"\'()').lower() for w in text.split()))
-
-    # count hits from today's challenge
-    challenge = get_today_challenge()
-    gre_hits = 0
-    if challenge:
-        w = challenge.get("word", "").lower()
-        idiom = challenge.get("idiom", "").lower()
-        txt = text.lower()
-        if w and w in txt:
-            gre_hits += 1
-        if idiom and idiom in txt:
-            gre_hits += 1
+
+    # Basic analytics + hits from today's challenge
+    challenge = await get_today_challenge()
+    word = challenge.get("word", "") if challenge else ""
+    idiom = challenge.get("idiom", "") if challenge else ""
+    tokens, unique_words, gre_hits = _analyze(text, word, idiom)
 
     data = {
         "date": payload.date,
@@ -156,31 +259,39 @@ def submit_story(payload: StoryCreate):
         "unique_words": unique_words,
         "gre_hits": gre_hits,
     }
-    story_id = create_document("story", data)
-
-    # Add timeline event
-    create_document("timelineevent", {
-        "kind": "story",
-        "title": "Story submitted",
-        "detail": f"{tokens} tokens, {unique_words} unique words",
-        "ref_id": story_id,
-        "date": payload.date,
-    })
+    oid = ObjectId()
+    story_id = str(oid)
+
+    # Story and its timeline event, written concurrently
+    await asyncio.gather(
+        create_document("story", {"_id": oid, **data}),
+        create_document("timelineevent", {
+            "kind": "story",
+            "title": "Story submitted",
+            "detail": f"{tokens} tokens, {unique_words} unique words",
+            "ref_id": story_id,
+            "date": payload.date,
+        }),
+    )
 
     return {"story_id": story_id, **data}
 
 @app.post("/api/feedback/{story_id}")
-def generate_feedback(story_id: str):
+async def generate_feedback(story_id: str):
     # Fetch story
-    from bson import ObjectId
-    story_docs = list(db["story"].find({"_id": ObjectId(story_id)}))
-    if not story_docs:
+    story = await db["story"].find_one(
+        {"_id": ObjectId(story_id)},
+        projection={"text": 1, "gre_hits": 1, "date": 1},
+    )
+    if not story:
         raise HTTPException(status_code=404, detail="Story not found")
-    story = story_docs[0]
     text = story.get("text", "")
 
     # Lightweight heuristic feedback
-    sentences = [s.strip() for s in text.replace("?", ".").replace("!", ".").split(".") if s.strip()]
+    parts = _SENT_SPLIT.split(text)
+    # (sentence, terminator) pairs; the last sentence may have no terminator
+    pieces = [(s.strip(), t) for s, t in zip(parts[0::2], parts[1::2] + [""]) if s.strip()]
+    sentences = [s for s, _ in pieces]
     avg_len = sum(len(s.split()) for s in sentences) / max(1, len(sentences))
     readability = "concise" if avg_len < 14 else "balanced" if avg_len < 22 else "wordy"
 
@@ -201,9 +312,7 @@ def generate_feedback(story_id: str):
         strengths.append("Good rhythm and flow")
 
     # "Best version" pass: trim spaces, title-case sentences lightly
-    best_version = ". ".join(s.capitalize() for s in [s.strip() for s in text.split(".") if s.strip()])
-    if text.endswith("."):
-        best_version += "."
+    best_version = " ".join(s.capitalize() + t for s, t in pieces)
 
     score = min(100, 60 + story.get("gre_hits", 0) * 10 + (10 if readability == "balanced" else 0))
 
@@ -215,24 +324,29 @@ def generate_feedback(story_id: str):
         "best_version": best_version,
         "score": int(score),
     }
-    fid = create_document("feedback", feedback_doc)
-
-    # timeline
-    create_document("timelineevent", {
-        "kind": "feedback",
-        "title": f"Feedback score: {int(score)}",
-        "detail": readability,
-        "ref_id": fid,
-        "date": story.get("date", today_str()),
-    })
+    oid = ObjectId()
+    fid = str(oid)
+
+    # feedback + timeline
+    await asyncio.gather(
+        create_document("feedback", {"_id": oid, **feedback_doc}),
+        create_document("timelineevent", {
+            "kind": "feedback",
+            "title": f"Feedback score: {int(score)}",
+            "detail": readability,
+            "ref_id": fid,
+            "date": story.get("date", today_str()),
+        }),
+    )
 
     return {"feedback_id": fid, **feedback_doc}
 
 # ---------- Practice ----------
 
-@app.get("/api/practice/quiz")
-def get_quiz():
-    ch = get_today_challenge()
+# Correct choice index for each question built by _build_quiz
+_QUIZ_ANSWERS = (0, 0, 1, 0, 0)
+
+def _build_quiz(ch: Dict[str, Any]) -> Dict[str, Any]:
     # Simple 5-question quiz: meanings and usage
     questions: List[Dict[str, Any]] = []
 
@@ -245,7 +359,7 @@ def get_quiz():
             "complete agreement",
             "extreme scarcity",
         ],
-        "answer": 0,
+        "answer": _QUIZ_ANSWERS[0],
     })
     # Q2 idiom meaning
     questions.append({
@@ -256,13 +370,13 @@ def get_quiz():
             "to agree reluctantly",
             "to speak frankly",
         ],
-        "answer": 0,
+        "answer": _QUIZ_ANSWERS[1],
     })
     # Q3 usage true/false
     questions.append({
         "prompt": f"True or False: Using '{ch['word']}' means being extremely talkative.",
         "choices": ["True", "False"],
-        "answer": 1,
+        "answer": _QUIZ_ANSWERS[2],
     })
     # Q4 select best sentence
     questions.append({
@@ -273,7 +387,7 @@ def get_quiz():
             "They idiom the plan yesterday.",
             "The book was very once in a blue moon.",
         ],
-        "answer": 0,
+        "answer": _QUIZ_ANSWERS[3],
     })
     # Q5 identify idiom context
     questions.append({
@@ -284,76 +398,104 @@ def get_quiz():
             "Talking about heavy rainfall",
             "Explaining a legal contract",
         ],
-        "answer": 0,
+        "answer": _QUIZ_ANSWERS[4],
     })
 
     return {"date": ch["date"], "questions": questions}
 
+@app.get("/api/practice/quiz")
+async def get_quiz_endpoint(request: Request, response: Response):
+    etag = f'"quiz-{today_str()}"'
+    if _cache_headers(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
+    return await get_quiz()
+
+async def get_quiz():
+    ch = await get_today_challenge()
+    quiz = _quiz_cache.get(ch["date"])
+    if quiz is None:
+        quiz = _build_quiz(ch)
+        _quiz_cache[ch["date"]] = quiz
+    return quiz
+
 @app.post("/api/practice/submit")
-def submit_quiz(payload: PracticeSubmit):
-    # For validation, rebuild the quiz answers
-    quiz = get_quiz()
+async def submit_quiz(payload: PracticeSubmit):
     answers = payload.answers
-    if len(answers) != len(quiz["questions"]):
+    if len(answers) != len(_QUIZ_ANSWERS):
         raise HTTPException(status_code=400, detail="Invalid number of answers")
 
+    # Grading only needs the fixed answer key; the (cached) quiz supplies prompts
+    quiz = await get_quiz()
     correct = 0
     breakdown = []
-    for i, q in enumerate(quiz["questions"]):
-        is_correct = int(answers[i]) == int(q["answer"])
+    for q, chosen, expected in zip(quiz["questions"], answers, _QUIZ_ANSWERS):
+        is_correct = int(chosen) == expected
         correct += 1 if is_correct else 0
         breakdown.append({
             "prompt": q["prompt"],
-            "chosen": int(answers[i]),
-            "correct": int(q["answer"]),
+            "chosen": int(chosen),
+            "correct": expected,
             "is_correct": is_correct,
         })
 
-    total = len(quiz["questions"]) 
+    total = len(_QUIZ_ANSWERS)
     result = {
         "date": payload.date,
         "correct": correct,
         "total": total,
         "breakdown": breakdown,
     }
-    rid = create_document("practiceresult", result)
-
-    create_document("timelineevent", {
-        "kind": "practice",
-        "title": f"Practice: {correct}/{total}",
-        "detail": "Quiz completed",
-        "ref_id": rid,
-        "date": payload.date,
-    })
+    oid = ObjectId()
+    rid = str(oid)
+
+    await asyncio.gather(
+        create_document("practiceresult", {"_id": oid, **result}),
+        create_document("timelineevent", {
+            "kind": "practice",
+            "title": f"Practice: {correct}/{total}",
+            "detail": "Quiz completed",
+            "ref_id": rid,
+            "date": payload.date,
+        }),
+    )
 
     return {"result_id": rid, **result}
 
 # ---------- Timeline ----------
 
+TIMELINE_LIMIT = 25
+
+# Fields the activity feed renders; _id is always included
+TIMELINE_PROJECTION = {"kind": 1, "title": 1, "detail": 1, "ref_id": 1, "date": 1, "created_at": 1}
+
 @app.get("/api/timeline")
-def get_timeline():
-    docs = db["timelineevent"].find().sort("created_at", -1).limit(25)
-    items = []
-    for d in docs:
-        d["_id"] = str(d["_id"])
-        items.append(d)
+async def get_timeline():
+    cursor = db["timelineevent"].find({}, TIMELINE_PROJECTION).sort("_id", -1).batch_size(TIMELINE_LIMIT).limit(TIMELINE_LIMIT)
+    items = await cursor.to_list(length=TIMELINE_LIMIT)
+    for it in items:
+        it["_id"] = str(it["_id"])
     return {"items": items}
 
 # ---------- Schemas endpoint (for viewer tools) ----------
 
+def _model_fields(model):
+    return {name: str(field.annotation) for name, field in model.model_fields.items()}
+
+# Model definitions are fixed at import time, so the reflection runs once
+@functools.lru_cache(maxsize=1)
+def _schemas_payload():
+    return {
+        "challenge": _model_fields(Challenge),
+        "story": _model_fields(Story),
+        "feedback": _model_fields(Feedback),
+        "timelineevent": _model_fields(Timelineevent),
+        "practiceresult": _model_fields(Practiceresult),
+    }
+
 @app.get("/schema")
-def read_schemas():
+async def read_schemas():
     try:
-        from schemas import Challenge, Story, Feedback, Timelineevent, Practiceresult
-        def model_fields(model):
-            return {name: str(field.annotation) for name, field in model.model_fields.items()}
-        return {
-            "challenge": model_fields(Challenge),
-            "story": model_fields(Story),
-            "feedback": model_fields(Feedback),
-            "timelineevent": model_fields(Timelineevent),
-            "practiceresult": model_fields(Practiceresult),
-        }
+        return _schemas_payload()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -361,4 +503,5 @@ def read_schemas():
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+    uvicorn.run("main:app", host="0.0.0.0", port=port, loop="auto", http="auto", workers=workers)